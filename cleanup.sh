@@ -12,14 +12,15 @@ VENV_PATH="$HOME/venv"  # Path for the virtual environment
 
 echo "Starting cleanup process for $DOMAIN..."
 
-# Stop and disable Flask app service
-echo "Stopping and disabling Flask app service..."
-sudo systemctl stop flask_app
-sudo systemctl disable flask_app
+# Stop and disable Flask app and worker services
+echo "Stopping and disabling Flask app and worker services..."
+sudo systemctl stop flask_app flask_worker
+sudo systemctl disable flask_app flask_worker
 
-# Remove Flask app service file
-echo "Removing Flask app service file..."
+# Remove Flask app and worker service files
+echo "Removing Flask app and worker service files..."
 sudo rm /etc/systemd/system/flask_app.service
+sudo rm /etc/systemd/system/flask_worker.service
 
 # Reload systemd
 sudo systemctl daemon-reload
@@ -3,6 +3,8 @@
 # Configuration variables
 CLIENT_MAX_BODY_SIZE="20M"  # Adjust this value based on your maximum expected file size
 VENV_PATH="$HOME/venv"  # Path for the virtual environment
+DATA_DIR="$HOME/app/jobs"  # Uploaded documents and exports, shared by the app and worker services on this host
+JOB_STORE="$HOME/jobs.db"  # SQLite job store; must be on a local disk of this host, not a network mount
 
 # Check if domain name is provided
 if [ $# -eq 0 ]; then
@@ -94,6 +96,8 @@ WorkingDirectory=$USER_HOME/app
 ExecStart=$VENV_PATH/bin/gunicorn --workers 3 --bind 127.0.0.1:8000 --timeout 120 app:app
 Restart=always
 Environment=PATH=$VENV_PATH/bin
+Environment=CONVERTNOTES_DATA_DIR=$DATA_DIR
+Environment=CONVERTNOTES_JOB_STORE=$JOB_STORE
 StandardOutput=journal
 StandardError=journal
 
@@ -101,10 +105,31 @@ StandardError=journal
 WantedBy=multi-user.target
 EOT
 
-# Reload systemd, start and enable Flask app service
+# Set up systemd service for the converter workers
+sudo tee /etc/systemd/system/flask_worker.service << EOT
+[Unit]
+Description=Converter workers for Flask app
+After=network.target
+
+[Service]
+User=$USER
+WorkingDirectory=$USER_HOME/app
+ExecStart=$VENV_PATH/bin/python worker.py
+Restart=always
+Environment=PATH=$VENV_PATH/bin
+Environment=CONVERTNOTES_DATA_DIR=$DATA_DIR
+Environment=CONVERTNOTES_JOB_STORE=$JOB_STORE
+StandardOutput=journal
+StandardError=journal
+
+[Install]
+WantedBy=multi-user.target
+EOT
+
+# Reload systemd, start and enable Flask app and worker services
 sudo systemctl daemon-reload
-sudo systemctl start flask_app
-sudo systemctl enable flask_app
+sudo systemctl start flask_app flask_worker
+sudo systemctl enable flask_app flask_worker
 
 # Check if the service started successfully
 if ! sudo systemctl is-active --quiet flask_app; then
@@ -112,6 +137,11 @@ if ! sudo systemctl is-active --quiet flask_app; then
     sudo journalctl -u flask_app.service -n 50
     exit 1
 fi
+if ! sudo systemctl is-active --quiet flask_worker; then
+    echo "Error: Converter worker service failed to start. Checking logs..."
+    sudo journalctl -u flask_worker.service -n 50
+    exit 1
+fi
 
 # Verify Nginx configuration
 sudo nginx -t
@@ -127,7 +157,7 @@ echo "Recent Nginx error logs:"
 sudo tail -n 20 /var/log/nginx/error.log
 
 # Final status check
-if sudo systemctl is-active --quiet flask_app && sudo systemctl is-active --quiet nginx; then
+if sudo systemctl is-active --quiet flask_app && sudo systemctl is-active --quiet flask_worker && sudo systemctl is-active --quiet nginx; then
     echo "Deployment completed. Your Flask app should now be running at http://$DOMAIN"
     echo "If you encounter issues, please review the logs and checks above."
 else
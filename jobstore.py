@@ -0,0 +1,385 @@
+import os
+import abc
+import zipfile
+import shutil
+import sqlite3
+import importlib
+import time
+import uuid
+import logging
+
+# Shared state for the web tier and the converter workers. The job store holds job state, per-file
+# progress and artifact locations; DATA_DIR holds the uploaded documents and the exports.
+#
+# The backend is chosen with CONVERTNOTES_JOB_STORE_BACKEND: 'sqlite' (the default) or a
+# 'module:Class' path to another JobStore implementation, constructed without arguments.
+# SQLiteJobStore is single-host only: any number of app server and worker processes may share it,
+# but they must all run on the machine that holds the database.
+DATA_DIR = os.environ.get('CONVERTNOTES_DATA_DIR', 'jobs')
+JOB_STORE_BACKEND = os.environ.get('CONVERTNOTES_JOB_STORE_BACKEND', 'sqlite')
+JOB_STORE_PATH = os.environ.get('CONVERTNOTES_JOB_STORE', os.path.expanduser('~/jobs.db'))
+LEASE_SECONDS = int(os.environ.get('CONVERTNOTES_LEASE_SECONDS', '600'))
+MAX_ATTEMPTS = int(os.environ.get('CONVERTNOTES_MAX_ATTEMPTS', '3'))
+RETENTION_SECONDS = int(os.environ.get('CONVERTNOTES_RETENTION_SECONDS', str(24 * 60 * 60)))
+
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ceph', 'glusterfs', 'fuse.sshfs', 'lustre', '9p'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    import_dir TEXT NOT NULL,
+    export_dir TEXT NOT NULL,
+    artifact TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finalizing_at REAL,
+    finalize_attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_status ON files(status, claimed_at);
+CREATE INDEX IF NOT EXISTS files_job ON files(job_id, status);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at);
+'''
+
+def log_exception(e):
+    logging.error(e, exc_info=True)
+
+def log_info(message):
+    logging.info(message)
+
+
+class JobStore(abc.ABC):
+    # Jobs move from 'running' to 'finalizing' to 'done', or end in 'failed' when their export cannot
+    # be built. Files move from 'pending' to 'claimed', then 'publishing' while the worker moves its
+    # note into the export, then 'successful'; or to 'unsuccessful'. A file whose claim expires
+    # MAX_ATTEMPTS times is marked 'unsuccessful'. Finalize claims are identified by a token that
+    # finish_job and fail_job must present.
+
+    @abc.abstractmethod
+    def create_job(self, job_id, import_dir, export_dir, paths):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim_file(self, worker):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def complete_file(self, file_id, worker, successful):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def publish_file(self, file_id, worker):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim_finalize(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim_stale_finalize(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def finish_job(self, job_id, token, artifact):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fail_job(self, job_id, token, error):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_job(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def progress(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def expired_jobs(self, before):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_job(self, job_id):
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+
+    def __init__(self, path=JOB_STORE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            # WAL relies on shared memory between processes of one host and breaks on network filesystems.
+            if is_network_filesystem(path):
+                logging.warning(f"Job store {path} is on a network filesystem; SQLite locking is not reliable across hosts")
+                conn.execute('PRAGMA journal_mode=DELETE')
+            else:
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Connection(conn)
+
+    def create_job(self, job_id, import_dir, export_dir, paths):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO jobs (id, status, import_dir, export_dir, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (job_id, 'running', import_dir, export_dir, time.time()))
+            conn.executemany('INSERT INTO files (job_id, name, path, status) VALUES (?, ?, ?, ?)',
+                             [(job_id, os.path.basename(p), p, 'pending') for p in paths])
+            conn.execute('COMMIT')
+        return job_id
+
+    def claim_file(self, worker):
+        # Claims that outlive their lease belong to a worker that died and are handed out again,
+        # unless the document has already used up its attempts.
+        now = time.time()
+        stale = now - self.lease_seconds
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''UPDATE files SET status = 'unsuccessful'
+                            WHERE status IN ('claimed', 'publishing') AND claimed_at < ? AND attempts >= ?''',
+                         (stale, self.max_attempts))
+            row = conn.execute('''SELECT files.id, files.job_id, files.path, jobs.export_dir FROM files
+                                  JOIN jobs ON jobs.id = files.job_id
+                                  WHERE files.status = 'pending'
+                                  OR (files.status IN ('claimed', 'publishing') AND files.claimed_at < ?)
+                                  ORDER BY files.id LIMIT 1''', (stale,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute('''UPDATE files SET status = 'claimed', worker = ?, claimed_at = ?, attempts = attempts + 1
+                            WHERE id = ?''', (worker, now, row['id']))
+            conn.execute('COMMIT')
+        return dict(row)
+
+    def complete_file(self, file_id, worker, successful):
+        with self._connect() as conn:
+            cursor = conn.execute('''UPDATE files SET status = ? WHERE id = ? AND worker = ? AND status = 'claimed' ''',
+                                  ('publishing' if successful else 'unsuccessful', file_id, worker))
+            return cursor.rowcount == 1
+
+    def publish_file(self, file_id, worker):
+        with self._connect() as conn:
+            cursor = conn.execute('''UPDATE files SET status = 'successful'
+                                     WHERE id = ? AND worker = ? AND status = 'publishing' ''', (file_id, worker))
+            return cursor.rowcount == 1
+
+    def claim_finalize(self, job_id):
+        # Only one caller wins, and only once no file of the job is still outstanding.
+        token = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute('''UPDATE jobs SET status = 'finalizing', finalizing_at = ?,
+                                     finalize_attempts = finalize_attempts + 1
+                                     WHERE id = ? AND status = 'running'
+                                     AND NOT EXISTS (SELECT 1 FROM files WHERE job_id = ?
+                                                     AND status IN ('pending', 'claimed', 'publishing'))''',
+                                  (token, job_id, job_id))
+            return token if cursor.rowcount == 1 else None
+
+    def claim_stale_finalize(self):
+        # Covers a worker that died between its last document and claim_finalize, and one that
+        # died or stalled while building the export.
+        token = time.time()
+        stale = token - self.lease_seconds
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''UPDATE jobs SET status = 'failed', error = 'Export could not be built.'
+                            WHERE status = 'finalizing' AND finalizing_at < ? AND finalize_attempts >= ?''',
+                         (stale, self.max_attempts))
+            row = conn.execute('''SELECT id FROM jobs
+                                  WHERE (status = 'finalizing' AND finalizing_at < ?)
+                                  OR (status = 'running' AND NOT EXISTS (SELECT 1 FROM files WHERE job_id = jobs.id
+                                                                         AND status IN ('pending', 'claimed', 'publishing')))
+                                  ORDER BY created_at LIMIT 1''', (stale,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute('''UPDATE jobs SET status = 'finalizing', finalizing_at = ?,
+                            finalize_attempts = finalize_attempts + 1 WHERE id = ?''', (token, row['id']))
+            conn.execute('COMMIT')
+        return row['id'], token
+
+    def finish_job(self, job_id, token, artifact):
+        with self._connect() as conn:
+            cursor = conn.execute('''UPDATE jobs SET status = 'done', artifact = ?
+                                     WHERE id = ? AND status = 'finalizing' AND finalizing_at = ?''',
+                                  (artifact, job_id, token))
+            return cursor.rowcount == 1
+
+    def fail_job(self, job_id, token, error):
+        with self._connect() as conn:
+            cursor = conn.execute('''UPDATE jobs SET status = 'failed', error = ?
+                                     WHERE id = ? AND status = 'finalizing' AND finalizing_at = ?''',
+                                  (error, job_id, token))
+            return cursor.rowcount == 1
+
+    def get_job(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def progress(self, job_id):
+        with self._connect() as conn:
+            job = conn.execute('SELECT status, error FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            rows = conn.execute('SELECT name, status FROM files WHERE job_id = ? ORDER BY id', (job_id,)).fetchall()
+        successful = sum(1 for row in rows if row['status'] == 'successful')
+        unsuccessful = [row['name'] for row in rows if row['status'] == 'unsuccessful']
+        return {'total': len(rows), 'processed': successful + len(unsuccessful), 'successful': successful,
+                'unsuccessful': unsuccessful, 'done': job['status'] == 'done',
+                'failed': job['status'] == 'failed', 'error': job['error']}
+
+    def expired_jobs(self, before):
+        with self._connect() as conn:
+            rows = conn.execute('''SELECT * FROM jobs WHERE status IN ('done', 'failed') AND created_at < ?''',
+                                (before,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_job(self, job_id):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM files WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            conn.execute('COMMIT')
+
+
+class _Connection:
+    # Closes the underlying sqlite3 connection on exit, which sqlite3's own context manager does not.
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute('ROLLBACK')
+        self.conn.close()
+
+
+JOB_STORE_BACKENDS = {'sqlite': SQLiteJobStore}
+
+def is_network_filesystem(path):
+    # Best effort: look up the filesystem type holding path in /proc/mounts.
+    try:
+        path = os.path.realpath(os.path.dirname(os.path.abspath(path)))
+        best, fstype = '', None
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) >= len(best):
+                    best, fstype = mount_point, fields[2]
+        return fstype in NETWORK_FILESYSTEMS
+    except OSError:
+        return False
+
+def get_job_store(backend=JOB_STORE_BACKEND):
+    if backend in JOB_STORE_BACKENDS:
+        return JOB_STORE_BACKENDS[backend]()
+    module_name, _, class_name = backend.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def job_dir(job_id):
+    # Paths are stored in the job store, so they must not depend on each process's working directory.
+    return os.path.join(os.path.abspath(DATA_DIR), job_id)
+
+def unique_name(used, name):
+    stem, ext = os.path.splitext(name)
+    candidate, suffix = name, 0
+    while candidate in used:
+        suffix += 1
+        candidate = f"{stem} ({suffix}){ext}"
+    used.add(candidate)
+    return candidate
+
+def convert_claimed_file(store, worker, claimed, convert):
+    log_info(f"Starting convert_claimed_file function for document: {claimed['path']}")
+    # Each claim converts into its own directory and only the current holder of the claim moves it
+    # into the export, so a worker whose lease expired leaves nothing behind.
+    claim_dir = os.path.join(os.path.dirname(claimed['export_dir']), 'claims', uuid.uuid4().hex)
+    try:
+        converted = convert(claimed['path'], claim_dir)
+        if not store.complete_file(claimed['id'], worker, converted):
+            log_info(f"Claim on {claimed['path']} expired before it finished, result discarded")
+            return False
+        if converted:
+            # One directory per document, so a retry after a crash mid-publish cannot add it twice.
+            target = os.path.join(claimed['export_dir'], str(claimed['id']))
+            os.makedirs(claimed['export_dir'], exist_ok=True)
+            if not os.path.exists(target):
+                os.rename(claim_dir, target)
+            store.publish_file(claimed['id'], worker)
+        log_info(f"Completed convert_claimed_file function for document: {claimed['path']}")
+        return True
+    finally:
+        shutil.rmtree(claim_dir, ignore_errors=True)
+
+def finalize_job(store, job_id):
+    token = store.claim_finalize(job_id)
+    if token is None:
+        return False
+    build_export(store, job_id, token)
+    return True
+
+def finalize_stale_jobs(store):
+    claimed = store.claim_stale_finalize()
+    if claimed is None:
+        return False
+    build_export(store, *claimed)
+    return True
+
+def build_export(store, job_id, token):
+    log_info(f"Starting build_export function for job: {job_id}")
+    job = store.get_job(job_id)
+    output_zip_path = os.path.join(os.path.dirname(job['export_dir']), f"exports-{uuid.uuid4().hex}.zip")
+    temp_zip_path = output_zip_path + '.tmp'
+    try:
+        used = set()
+        with zipfile.ZipFile(temp_zip_path, 'w') as zipf:
+            for root, _, files in os.walk(job['export_dir']):
+                for file in sorted(files):
+                    zipf.write(os.path.join(root, file), unique_name(used, file))
+        os.replace(temp_zip_path, output_zip_path)
+    except Exception as e:
+        log_exception(e)
+        if os.path.exists(temp_zip_path):
+            os.remove(temp_zip_path)
+        store.fail_job(job_id, token, "Export could not be built.")
+        return
+    if not store.finish_job(job_id, token, output_zip_path):
+        log_info(f"Finalize claim on job {job_id} expired before it finished, export discarded")
+        os.remove(output_zip_path)
+        return
+    shutil.rmtree(job['import_dir'], ignore_errors=True)
+    shutil.rmtree(job['export_dir'], ignore_errors=True)
+    shutil.rmtree(os.path.join(os.path.dirname(job['export_dir']), 'claims'), ignore_errors=True)
+    log_info(f"Completed build_export function, zip file created at {output_zip_path}")
+
+def expire_jobs(store, retention_seconds=RETENTION_SECONDS):
+    log_info("Starting expire_jobs function")
+    expired = store.expired_jobs(time.time() - retention_seconds)
+    for job in expired:
+        shutil.rmtree(os.path.dirname(job['export_dir']), ignore_errors=True)
+        store.delete_job(job['id'])
+    log_info(f"Completed expire_jobs function, {len(expired)} jobs removed")
@@ -1,6 +1,11 @@
 import os
 import zipfile
 import shutil
+import base64
+import argparse
+import tempfile
+import multiprocessing
+import threading
 import datetime
 import re
 import hashlib
@@ -218,6 +223,18 @@ def generate_xml(timestamp, title, tags, resources):
         log_exception(e)
         return ""
 
+def open_unique_enex(export_dir, title):
+    # Documents of one export are converted concurrently and often share a title; exclusive
+    # creation gives each its own file instead of letting them overwrite or interleave.
+    suffix = 0
+    while True:
+        name = f"{title}.enex" if suffix == 0 else f"{title} ({suffix}).enex"
+        enex_filename = os.path.join(export_dir, name)
+        try:
+            return open(enex_filename, 'x'), enex_filename
+        except FileExistsError:
+            suffix += 1
+
 def convert_to_note(document, export_dir):
     log_info(f"Starting convert_to_note function for document: {document}")
     try:
@@ -228,8 +245,8 @@ def convert_to_note(document, export_dir):
         if title == "":
             title = time_title(timestamp)
         xml = generate_xml(timestamp, title, tags, resources)
-        enex_filename = os.path.join(export_dir, f"{title}.enex")
-        with open(enex_filename, 'w') as enex_file:
+        enex_file, enex_filename = open_unique_enex(export_dir, title)
+        with enex_file:
             enex_file.write(xml)
             log_info(f"XML content saved as {enex_filename}")
         log_info(f"File {document} successfully converted.")
@@ -238,27 +255,6 @@ def convert_to_note(document, export_dir):
         log_exception(e)
         return False
 
-def convert_all_files(imports, exports):
-    log_info("Starting convert_all_files function")
-    try:
-        successful = 0
-        unsuccessful = []
-        if not os.path.exists(exports):
-            os.makedirs(exports)
-        docx_files = [f for f in os.listdir(imports) if f.endswith('.docx')]
-        log_info(f"Found {len(docx_files)} .docx files to convert")
-        for docx in docx_files:
-            docx_path = os.path.join(imports, docx)
-            if convert_to_note(docx_path, exports):
-                successful += 1
-            else:
-                unsuccessful.append(docx)
-        log_info(f"Completed convert_all_files function, {successful} files successfully converted, {len(unsuccessful)} files failed.")
-        return successful, unsuccessful
-    except Exception as e:
-        log_exception(e)
-        return 0, []
-
 def count_files(directory):
     log_info(f"Starting count_files function for directory: {directory}")
     try:
@@ -269,61 +265,188 @@ def count_files(directory):
         log_exception(e)
         return 0
 
+def collect_archives(inputs):
+    log_info("Starting collect_archives function")
+    archives = []
+    missing = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.zip'):
+                    archives.append(os.path.join(path, name))
+        elif os.path.isfile(path):
+            archives.append(path)
+        else:
+            missing.append(path)
+    log_info(f"Completed collect_archives function, found {len(archives)} archives, {len(missing)} missing")
+    return archives, missing
+
+def extract_archive(zip_file_path, import_dir):
+    log_info(f"Starting extract_archive function for archive: {zip_file_path}")
+    os.makedirs(import_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        for member in zip_ref.namelist():
+            if not member.endswith('/'):
+                member_path = os.path.join(import_dir, os.path.basename(member))
+                with zip_ref.open(member) as source, open(member_path, "wb") as target:
+                    shutil.copyfileobj(source, target)
+    log_info(f"Completed extract_archive function for archive: {zip_file_path}")
+
+def zip_directory(export_dir, output_zip_path):
+    log_info(f"Starting zip_directory function for directory: {export_dir}")
+    with zipfile.ZipFile(output_zip_path, 'w') as zipf:
+        for root, _, files in os.walk(export_dir):
+            for file in files:
+                zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), export_dir))
+    log_info(f"Completed zip_directory function, zip file created at {output_zip_path}")
+
+def convert_task(task):
+    docx_path, export_dir = task
+    return os.path.basename(docx_path), convert_to_note(docx_path, export_dir)
+
+def convert_archives(archives, output_paths, work_dir, workers):
+    log_info(f"Starting convert_archives function for {len(archives)} archives")
+    jobs = []
+    # Documents completed by the pool are counted off on its result thread, while the main thread
+    # keeps extracting. Extraction waits once enough documents are queued to keep every worker busy,
+    # so scratch space only holds the archives that are currently in flight.
+    condition = threading.Condition()
+    outstanding = [0]
+    max_outstanding = workers * 4
+
+    def finish_archive(job):
+        try:
+            zip_directory(job['exports'], job['output'])
+        except Exception as e:
+            log_exception(e)
+            job['error'] = str(e)
+        shutil.rmtree(job['scratch'], ignore_errors=True)
+
+    def document_done(job, docx, converted):
+        if converted:
+            job['successful'] += 1
+        else:
+            job['unsuccessful'].append(docx)
+        job['remaining'] -= 1
+        if job['remaining'] == 0:
+            finish_archive(job)
+        with condition:
+            outstanding[0] -= 1
+            condition.notify_all()
+
+    with multiprocessing.Pool(workers) as pool:
+        for index, zip_file_path in enumerate(archives):
+            with condition:
+                condition.wait_for(lambda: outstanding[0] < max_outstanding)
+            scratch = os.path.join(work_dir, str(index))
+            import_dir = os.path.join(scratch, 'imports')
+            export_dir = os.path.join(scratch, 'exports')
+            job = {'archive': zip_file_path, 'output': output_paths[index], 'scratch': scratch, 'exports': export_dir,
+                   'total': 0, 'successful': 0, 'unsuccessful': [], 'remaining': 0, 'error': None}
+            jobs.append(job)
+            try:
+                extract_archive(zip_file_path, import_dir)
+                os.makedirs(export_dir, exist_ok=True)
+                job['total'] = count_files(import_dir)
+                docx_files = [f for f in os.listdir(import_dir) if f.endswith('.docx')]
+            except Exception as e:
+                log_exception(e)
+                job['error'] = str(e)
+                shutil.rmtree(scratch, ignore_errors=True)
+                continue
+            log_info(f"Scheduling {len(docx_files)} .docx files from {zip_file_path}")
+            if not docx_files:
+                finish_archive(job)
+                continue
+            job['remaining'] = len(docx_files)
+            with condition:
+                outstanding[0] += len(docx_files)
+            for docx in docx_files:
+                pool.apply_async(convert_task, ((os.path.join(import_dir, docx), export_dir),),
+                                 callback=lambda result, job=job: document_done(job, result[0], result[1]),
+                                 error_callback=lambda e, job=job, docx=docx: document_done(job, docx, False))
+        with condition:
+            condition.wait_for(lambda: outstanding[0] == 0)
+    log_info("Completed convert_archives function")
+    return jobs
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Convert .docx note exports to Evernote .enex archives.")
+    parser.add_argument('inputs', nargs='+', help="zip files, or directories containing zip files")
+    parser.add_argument('-o', '--output', help="output zip path (single archive only, default: exports.zip)")
+    parser.add_argument('-d', '--output-dir', default='.', help="directory for per-archive output zips when converting several archives")
+    parser.add_argument('-w', '--work-dir', help="scratch directory for extracted and converted files (default: a fresh temporary directory)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes shared by all archives")
+    return parser.parse_args(argv)
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <path_to_zip_file>")
+    args = parse_args(sys.argv[1:])
+
+    archives, missing = collect_archives(args.inputs)
+    for path in missing:
+        print(f"File {path} does not exist.")
+    if missing:
+        sys.exit(1)
+    if not archives:
+        print("No zip files to convert.")
         sys.exit(1)
-    
-    zip_file_path = sys.argv[1]
 
-    if not os.path.exists(zip_file_path):
-        print(f"File {zip_file_path} does not exist.")
+    # Output naming follows what was asked for, so a directory holding one zip still gets <name>_exports.zip.
+    batch = len(args.inputs) > 1 or os.path.isdir(args.inputs[0])
+    if args.output and batch:
+        print("--output can only be used with a single archive, use --output-dir instead.")
         sys.exit(1)
 
-    UPLOAD_FOLDER = 'imports'
-    EXPORT_FOLDER = 'exports'
+    if not batch:
+        output_paths = [args.output or os.path.join(args.output_dir, 'exports.zip')]
+    else:
+        output_paths = [os.path.join(args.output_dir, os.path.splitext(os.path.basename(a))[0] + '_exports.zip')
+                        for a in archives]
+    if len(set(map(os.path.abspath, output_paths))) != len(output_paths):
+        print("Two input archives share a file name, so their outputs would overwrite each other.")
+        sys.exit(1)
+    for output_path in output_paths:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
 
-    if os.path.exists(UPLOAD_FOLDER):
-        shutil.rmtree(UPLOAD_FOLDER)
-    if os.path.exists(EXPORT_FOLDER):
-        shutil.rmtree(EXPORT_FOLDER)
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+    # A private scratch directory per run keeps concurrent invocations on the same box apart.
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        work_dir = tempfile.mkdtemp(dir=args.work_dir)
+    else:
+        work_dir = tempfile.mkdtemp(prefix='convertnotes_')
 
+    failed = False
     try:
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            for member in zip_ref.namelist():
-                if not member.endswith('/'):
-                    member_path = os.path.join(UPLOAD_FOLDER, os.path.basename(member))
-                    with zip_ref.open(member) as source, open(member_path, "wb") as target:
-                        shutil.copyfileobj(source, target)
-
-        imports_count = count_files(UPLOAD_FOLDER)
-        successful, unsuccessful = convert_all_files(UPLOAD_FOLDER, EXPORT_FOLDER)
-        
-        print(f"Total files: {imports_count}")
-        print(f"Successfully converted: {successful}")
-        if unsuccessful:
-            print(f"Failed to convert: {len(unsuccessful)}")
-            print("Unsuccessful files:")
-            for file in unsuccessful:
-                print(f" - {file}")
-
-        output_zip_path = 'exports.zip'
-        with zipfile.ZipFile(output_zip_path, 'w') as zipf:
-            for root, _, files in os.walk(EXPORT_FOLDER):
-                for file in files:
-                    zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), EXPORT_FOLDER))
-        print("Cleaning up...")
-        if os.path.exists(UPLOAD_FOLDER):
-            shutil.rmtree(UPLOAD_FOLDER)
-        if os.path.exists(EXPORT_FOLDER):
-            shutil.rmtree(EXPORT_FOLDER)
-        print(f"Conversion complete. Output ZIP file: {output_zip_path}")
+        jobs = convert_archives(archives, output_paths, work_dir, max(1, args.workers))
+
+        for job in jobs:
+            print(f"Archive: {job['archive']}")
+            if job['error'] is not None:
+                failed = True
+                print(f"An error occurred: {job['error']}")
+                continue
+            print(f"Total files: {job['total']}")
+            print(f"Successfully converted: {job['successful']}")
+            if job['unsuccessful']:
+                failed = True
+                print(f"Failed to convert: {len(job['unsuccessful'])}")
+                print("Unsuccessful files:")
+                for file in job['unsuccessful']:
+                    print(f" - {file}")
+            print(f"Output ZIP file: {job['output']}")
 
     except Exception as e:
         log_exception(e)
         print(f"An error occurred: {str(e)}")
+        sys.exit(1)
+    finally:
+        print("Cleaning up...")
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if failed:
+        print("Conversion finished with errors.")
+        sys.exit(1)
+    print("Conversion complete.")
 
 if __name__ == "__main__":
     main()
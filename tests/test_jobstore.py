@@ -0,0 +1,219 @@
+import os
+import sys
+import zipfile
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jobstore
+from jobstore import (JobStore, SQLiteJobStore, get_job_store, convert_claimed_file, finalize_job,
+                      finalize_stale_jobs, expire_jobs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteJobStore(str(tmp_path / 'jobs.db'), lease_seconds=60, max_attempts=2)
+
+
+def make_job(tmp_path, store, job_id, names):
+    import_dir = tmp_path / job_id / 'imports'
+    export_dir = tmp_path / job_id / 'exports'
+    import_dir.mkdir(parents=True)
+    export_dir.mkdir(parents=True)
+    store.create_job(job_id, str(import_dir), str(export_dir), [str(import_dir / name) for name in names])
+    return str(export_dir)
+
+
+def fake_convert(document, export_dir):
+    os.makedirs(export_dir, exist_ok=True)
+    with open(os.path.join(export_dir, 'Title.enex'), 'w') as enex_file:
+        enex_file.write(document)
+    return 'bad' not in os.path.basename(document)
+
+
+def convert(store, worker, claimed):
+    return convert_claimed_file(store, worker, claimed, fake_convert)
+
+
+def expire_claims(store, seconds):
+    with store._connect() as conn:
+        conn.execute('UPDATE files SET claimed_at = claimed_at - ?', (seconds,))
+        conn.execute('UPDATE jobs SET finalizing_at = finalizing_at - ?', (seconds,))
+
+
+def test_incomplete_backend_fails_on_construction():
+    class PartialStore(JobStore):
+        def create_job(self, job_id, import_dir, export_dir, paths):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_each_file_has_one_winner(tmp_path, store):
+    make_job(tmp_path, store, 'j1', [f'{i}.docx' for i in range(20)])
+    claims = []
+    lock = threading.Lock()
+
+    def claim_all(worker):
+        while True:
+            claimed = store.claim_file(worker)
+            if claimed is None:
+                return
+            with lock:
+                claims.append(claimed['id'])
+
+    threads = [threading.Thread(target=claim_all, args=(f'w{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claims) == sorted(set(claims))
+    assert len(claims) == 20
+
+
+def test_expired_claim_is_reclaimed_and_stale_result_ignored(tmp_path, store):
+    make_job(tmp_path, store, 'j1', ['a.docx'])
+    first = store.claim_file('w1')
+    assert store.claim_file('w2') is None
+    expire_claims(store, 120)
+    second = store.claim_file('w2')
+    assert second['id'] == first['id']
+    assert store.complete_file(first['id'], 'w1', True) is False
+    assert store.complete_file(second['id'], 'w2', True) is True
+
+
+def test_file_is_unsuccessful_after_max_attempts(tmp_path, store):
+    make_job(tmp_path, store, 'j1', ['a.docx'])
+    store.claim_file('w1')
+    expire_claims(store, 120)
+    store.claim_file('w2')
+    expire_claims(store, 120)
+    assert store.claim_file('w3') is None
+    assert store.progress('j1')['unsuccessful'] == ['a.docx']
+
+
+def test_finalize_only_once_all_files_complete(tmp_path, store):
+    export_dir = make_job(tmp_path, store, 'j1', ['a.docx', 'b.docx', 'bad.docx'])
+    first = store.claim_file('w1')
+    second = store.claim_file('w2')
+    third = store.claim_file('w3')
+    convert(store, 'w1', first)
+    convert(store, 'w3', third)
+    assert finalize_job(store, 'j1') is False
+    convert(store, 'w2', second)
+    assert finalize_job(store, 'j1') is True
+    assert finalize_job(store, 'j1') is False
+
+    job = store.get_job('j1')
+    assert job['status'] == 'done'
+    with zipfile.ZipFile(job['artifact']) as zipf:
+        assert zipf.namelist() == ['Title.enex', 'Title (1).enex']
+    assert not os.path.exists(export_dir)
+    assert sorted(os.listdir(tmp_path / 'j1')) == [os.path.basename(job['artifact'])]
+
+
+def test_reclaimed_file_is_exported_once(tmp_path, store):
+    export_dir = make_job(tmp_path, store, 'j1', ['a.docx'])
+    first = store.claim_file('w1')
+    expire_claims(store, 120)
+    second = store.claim_file('w2')
+    assert convert(store, 'w2', second) is True
+    assert convert(store, 'w1', first) is False
+
+    assert os.listdir(export_dir) == [str(second['id'])]
+    assert os.listdir(os.path.join(export_dir, str(second['id']))) == ['Title.enex']
+    assert os.listdir(tmp_path / 'j1' / 'claims') == []
+    assert finalize_job(store, 'j1') is True
+    with zipfile.ZipFile(store.get_job('j1')['artifact']) as zipf:
+        assert zipf.namelist() == ['Title.enex']
+
+
+def test_stale_builder_cannot_change_finished_job(tmp_path, store):
+    make_job(tmp_path, store, 'j1', [])
+    stale_token = store.claim_finalize('j1')
+    expire_claims(store, 120)
+    job_id, token = store.claim_stale_finalize()
+    assert store.finish_job(job_id, token, 'exports.zip') is True
+    assert store.fail_job('j1', stale_token, 'error') is False
+    assert store.finish_job('j1', stale_token, 'other.zip') is False
+    assert store.get_job('j1')['status'] == 'done'
+    assert store.get_job('j1')['artifact'] == 'exports.zip'
+
+
+def test_progress_counts(tmp_path, store):
+    make_job(tmp_path, store, 'j1', ['a.docx', 'b.docx', 'c.docx'])
+    assert store.progress('missing') is None
+    first = store.claim_file('w1')
+    second = store.claim_file('w1')
+    third = store.claim_file('w1')
+    convert(store, 'w1', first)
+    store.complete_file(second['id'], 'w1', False)
+    store.complete_file(third['id'], 'w1', True)
+    progress = store.progress('j1')
+    assert progress['total'] == 3
+    assert progress['processed'] == 2
+    assert progress['successful'] == 1
+    assert progress['unsuccessful'] == ['b.docx']
+    assert progress['done'] is False
+    assert progress['failed'] is False
+
+
+def test_stale_finalize_is_retried_then_failed(tmp_path, store):
+    make_job(tmp_path, store, 'j1', [])
+    assert store.claim_finalize('j1') is not None
+    assert store.claim_stale_finalize() is None
+    expire_claims(store, 120)
+    assert store.claim_stale_finalize()[0] == 'j1'
+    expire_claims(store, 120)
+    assert store.claim_stale_finalize() is None
+    progress = store.progress('j1')
+    assert progress['failed'] is True
+    assert progress['error']
+
+
+def test_job_left_running_is_finalized_by_sweep(tmp_path, store):
+    make_job(tmp_path, store, 'j1', ['a.docx'])
+    claimed = store.claim_file('w1')
+    store.complete_file(claimed['id'], 'w1', True)
+    assert finalize_stale_jobs(store) is False
+    store.publish_file(claimed['id'], 'w1')
+    assert finalize_stale_jobs(store) is True
+    assert store.progress('j1')['done'] is True
+
+
+def test_failed_export_marks_job_failed(tmp_path, store):
+    export_dir = make_job(tmp_path, store, 'j1', [])
+    os.rmdir(os.path.dirname(export_dir) + '/imports')
+    os.rmdir(export_dir)
+    os.rmdir(os.path.dirname(export_dir))
+    assert finalize_job(store, 'j1') is True
+    assert store.get_job('j1')['status'] == 'failed'
+
+
+def test_expire_jobs_removes_old_finished_jobs(tmp_path, store):
+    export_dir = make_job(tmp_path, store, 'old', [])
+    make_job(tmp_path, store, 'running', ['a.docx'])
+    finalize_job(store, 'old')
+    expire_jobs(store, retention_seconds=-1)
+    assert store.get_job('old') is None
+    assert not os.path.exists(os.path.dirname(export_dir))
+    assert store.get_job('running') is not None
+
+
+def test_backend_is_chosen_by_name(tmp_path, monkeypatch):
+    monkeypatch.setitem(jobstore.JOB_STORE_BACKENDS, 'sqlite', lambda: SQLiteJobStore(str(tmp_path / 'a.db')))
+    assert isinstance(get_job_store('sqlite'), SQLiteJobStore)
+    assert isinstance(get_job_store(f'{__name__}:TmpSQLiteJobStore'), TmpSQLiteJobStore)
+
+
+class TmpSQLiteJobStore(SQLiteJobStore):
+    def __init__(self):
+        super().__init__(':memory:')
+
+
+def test_job_dir_is_absolute(monkeypatch):
+    monkeypatch.setattr(jobstore, 'DATA_DIR', 'jobs')
+    assert os.path.isabs(jobstore.job_dir('j1'))
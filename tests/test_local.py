@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('aspose.words')
+
+import local
+
+
+def make_zip(path, names):
+    with zipfile.ZipFile(path, 'w') as zipf:
+        for name in names:
+            zipf.writestr(name, name)
+    return str(path)
+
+
+def zip_names(path):
+    with zipfile.ZipFile(path) as zipf:
+        return sorted(zipf.namelist())
+
+
+def fake_convert_to_note(document, export_dir):
+    # Documents named slow_* finish late, so the other archive completes first.
+    if os.path.basename(document).startswith('slow_'):
+        time.sleep(0.5)
+    with open(os.path.join(export_dir, os.path.basename(document) + '.enex'), 'w') as enex_file:
+        enex_file.write(document)
+    return 'bad' not in os.path.basename(document)
+
+
+@pytest.fixture
+def fake_convert(monkeypatch):
+    # The pool forks after the patch, so its workers see the fake as well.
+    monkeypatch.setattr(local, 'convert_to_note', fake_convert_to_note)
+
+
+def test_open_unique_enex(tmp_path):
+    names = []
+    for _ in range(3):
+        enex_file, enex_filename = local.open_unique_enex(str(tmp_path), 'Title')
+        enex_file.close()
+        names.append(os.path.basename(enex_filename))
+    assert names == ['Title.enex', 'Title (1).enex', 'Title (2).enex']
+
+
+def test_collect_archives(tmp_path):
+    folder = tmp_path / 'exports'
+    folder.mkdir()
+    b = make_zip(folder / 'b.zip', [])
+    a = make_zip(folder / 'a.zip', [])
+    (folder / 'notes.txt').write_text('')
+    c = make_zip(tmp_path / 'c.zip', [])
+    missing = str(tmp_path / 'missing.zip')
+    assert local.collect_archives([str(folder), c, missing]) == ([a, b, c], [missing])
+
+
+def test_archives_finish_in_interleaved_order(tmp_path, fake_convert):
+    a = make_zip(tmp_path / 'a.zip', ['slow_1.docx', '2.docx'])
+    b = make_zip(tmp_path / 'b.zip', ['3.docx', 'bad_4.docx'])
+    outputs = [str(tmp_path / 'a_exports.zip'), str(tmp_path / 'b_exports.zip')]
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    jobs = local.convert_archives([a, b], outputs, str(work_dir), 2)
+
+    assert [job['error'] for job in jobs] == [None, None]
+    assert [job['successful'] for job in jobs] == [2, 1]
+    assert jobs[1]['unsuccessful'] == ['bad_4.docx']
+    assert zip_names(outputs[0]) == ['2.docx.enex', 'slow_1.docx.enex']
+    assert zip_names(outputs[1]) == ['3.docx.enex', 'bad_4.docx.enex']
+    assert os.path.getmtime(outputs[1]) <= os.path.getmtime(outputs[0])
+    assert os.listdir(work_dir) == []
+
+
+def test_archive_without_documents(tmp_path, fake_convert):
+    a = make_zip(tmp_path / 'a.zip', ['notes.txt'])
+    output = str(tmp_path / 'exports.zip')
+
+    jobs = local.convert_archives([a], [output], str(tmp_path), 1)
+
+    assert jobs[0]['error'] is None
+    assert jobs[0]['total'] == 1
+    assert jobs[0]['successful'] == 0
+    assert zip_names(output) == []
+
+
+def test_extraction_failure_does_not_stop_other_archives(tmp_path, fake_convert):
+    broken = tmp_path / 'broken.zip'
+    broken.write_text('not a zip')
+    b = make_zip(tmp_path / 'b.zip', ['1.docx'])
+    outputs = [str(tmp_path / 'broken_exports.zip'), str(tmp_path / 'b_exports.zip')]
+
+    jobs = local.convert_archives([str(broken), b], outputs, str(tmp_path), 1)
+
+    assert jobs[0]['error'] is not None
+    assert not os.path.exists(outputs[0])
+    assert jobs[1]['error'] is None
+    assert zip_names(outputs[1]) == ['1.docx.enex']
+
+
+def test_main_fails_on_missing_input(tmp_path, monkeypatch):
+    a = make_zip(tmp_path / 'a.zip', ['1.docx'])
+    out = tmp_path / 'out'
+    monkeypatch.setattr(sys, 'argv', ['local.py', a, str(tmp_path / 'missing.zip'), '-d', str(out)])
+
+    with pytest.raises(SystemExit) as exit_info:
+        local.main()
+
+    assert exit_info.value.code == 1
+    assert not out.exists()
+
+
+def test_main_names_outputs_from_arguments(tmp_path, monkeypatch):
+    folder = tmp_path / 'exports'
+    folder.mkdir()
+    make_zip(folder / 'a.zip', [])
+    calls = []
+    monkeypatch.setattr(local, 'convert_archives', lambda archives, output_paths, work_dir, workers: calls.append(output_paths) or [])
+
+    monkeypatch.setattr(sys, 'argv', ['local.py', str(folder), '-d', str(tmp_path / 'out')])
+    local.main()
+    monkeypatch.setattr(sys, 'argv', ['local.py', str(folder / 'a.zip'), '-d', str(tmp_path / 'out')])
+    local.main()
+
+    assert calls == [[str(tmp_path / 'out' / 'a_exports.zip')], [str(tmp_path / 'out' / 'exports.zip')]]
+
+
+def test_main_rejects_output_for_batch(tmp_path, monkeypatch):
+    a = make_zip(tmp_path / 'a.zip', [])
+    b = make_zip(tmp_path / 'b.zip', [])
+    monkeypatch.setattr(sys, 'argv', ['local.py', a, b, '-o', str(tmp_path / 'x.zip')])
+
+    with pytest.raises(SystemExit) as exit_info:
+        local.main()
+
+    assert exit_info.value.code == 1
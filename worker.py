@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import multiprocessing
+from local import convert_to_note, log_info, log_exception
+from jobstore import get_job_store, convert_claimed_file, finalize_job, finalize_stale_jobs, expire_jobs
+
+# Converter worker: claims documents from the job store, converts them and zips each job once
+# its last document is done. While idle it also rebuilds exports whose builder died and expires
+# old jobs. Add worker processes (-j) to add capacity.
+
+EXPIRE_INTERVAL = 60
+
+def run_worker(poll_interval):
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    log_info(f"Starting converter worker {worker}")
+    store = get_job_store()
+    last_expired = 0
+    while True:
+        try:
+            claimed = store.claim_file(worker)
+            if claimed is None:
+                if finalize_stale_jobs(store):
+                    continue
+                if time.time() - last_expired > EXPIRE_INTERVAL:
+                    expire_jobs(store)
+                    last_expired = time.time()
+                time.sleep(poll_interval)
+                continue
+            if convert_claimed_file(store, worker, claimed, convert_to_note):
+                finalize_job(store, claimed['job_id'])
+        except Exception as e:
+            log_exception(e)
+            time.sleep(poll_interval)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run converter workers against the shared job store.")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="seconds to wait when there is nothing to claim")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    processes = [multiprocessing.Process(target=run_worker, args=(args.poll_interval,)) for _ in range(max(1, args.workers))]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()